@@ -1,303 +1,585 @@
 from flask import Flask, jsonify, request, send_from_directory
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
 from flask_cors import CORS
 import akshare as ak
+from cachetools import TTLCache
+import orjson
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+import functools
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
 import time
 
+# 日志级别默认INFO，逐请求的调试信息用debug输出，低于阈值时不做格式化也不写stdout
+logging.basicConfig(
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
+app.config['COMPRESS_MIN_SIZE'] = 500
+app.config['COMPRESS_LEVEL'] = 6
 CORS(app)
+Compress(app)
+
+class ORJSONProvider(DefaultJSONProvider):
+    """用orjson做JSON序列化，比标准库json快数倍，并能直接处理numpy数值"""
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # 直接使用orjson输出的bytes，省去一次decode/encode
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.option), mimetype=self.mimetype)
+
+app.json = ORJSONProvider(app)
+
+CACHE_DIR = '.cache'
+CACHE_VERSION = 3  # 缓存内容格式变化时递增，使旧缓存失效
+REPORT_CACHE_TTL = 24 * 3600        # 财报缓存24小时
+STOCK_LIST_CACHE_TTL = 7 * 24 * 3600  # A股列表缓存7天
+MEMORY_CACHE_CLEAR_INTERVAL = 3600  # 进程内报表缓存每小时清空一次
+STOCK_LIST_REFRESH_INTERVAL = 3600  # 内存中的A股列表每小时刷新一次
+STOCK_LIST_RETRY_INTERVAL = 60  # 尚无A股列表时，加载失败后60秒内不再重试，请求直接失败
+COMPANY_RESPONSE_MAX_AGE = 3600  # 公司财务数据允许浏览器/CDN缓存1小时
+COMPANY_RESPONSE_VERSION = 1  # 公司接口响应格式版本，格式变化时递增使客户端缓存的ETag失效
+INDICATOR_CACHE_TTL = 3600  # 计算好的财务指标缓存1小时
+FETCH_POOL_SIZE = 32  # 共享线程池大小，覆盖多个请求同时获取报表
+SEARCH_RESULT_LIMIT = 10  # 搜索最多返回的公司数
+HTTP_TIMEOUT = 20  # akshare未设置超时，出站请求默认20秒超时
+
+# 需要获取的三张报表
+REPORT_SYMBOLS = ('资产负债表', '利润表', '现金流量表')
+
+# 核心指标用到的报表项目
+NEEDED_ROWS_BY_DF = {
+    'balance': ('资产总计', '负债合计', '流动资产合计', '流动负债合计', '应付账款', '应收账款', '货币资金'),
+    'income': ('营业收入', '净利润', '营业成本'),
+    'cashflow': ('经营活动产生的现金流量净额',)
+}
+
+# 详细财务数据各分类的项目：(报表, 项目名)，报表为None表示需计算的衍生指标
+CATEGORY_SPECS = {
+    'cashFlowRisk': (
+        ('balance', '货币资金'),
+        ('balance', '流动负债合计'),
+        (None, '流动比率'),
+        ('cashflow', '经营活动产生的现金流量净额'),
+        ('income', '净利润'),
+        ('income', '营业成本')
+    ),
+    'supplyChainRisk': (
+        ('balance', '应付账款'),
+        ('balance', '预付款项'),
+        ('balance', '应付票据')
+    ),
+    'profitabilityRisk': (
+        ('income', '净利润'),
+        ('income', '营业收入'),
+        ('income', '营业成本'),
+        ('income', '营业利润'),
+        ('income', '利润总额')
+    ),
+    'otherRisk': (
+        ('balance', '应收账款'),
+        ('balance', '存货'),
+        ('balance', '固定资产'),
+        ('balance', '无形资产'),
+        ('balance', '资产总计'),
+        ('balance', '负债合计')
+    )
+}
+
+# 各分类用到的报表项目去重（如净利润、营业成本在多个分类中出现），每项只提取一次
+DETAIL_ITEMS = tuple(dict.fromkeys(
+    item for items in CATEGORY_SPECS.values() for item in items
+))
+
+# akshare内部直接调用 requests.get，每次都新建TCP+TLS连接。
+# 替换为共享Session的get，连接池复用keep-alive连接（影响本进程内所有 requests.get 调用）
+_http_session = requests.Session()
+_http_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=FETCH_POOL_SIZE)
+_http_session.mount('https://', _http_adapter)
+_http_session.mount('http://', _http_adapter)
+
+def _pooled_get(url, params=None, **kwargs):
+    kwargs.setdefault('timeout', HTTP_TIMEOUT)
+    return _http_session.get(url, params=params, **kwargs)
+
+requests.get = _pooled_get
+
+def with_retry(func, max_retries=3, backoff=0.5):
+    """包装API函数，失败后按指数退避重试（0.5s、1s…），成功路径不等待"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        delay = backoff
+        for i in range(max_retries):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                logger.warning("API call failed (attempt %d/%d): %s", i + 1, max_retries, e)
+                if i == max_retries - 1:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+    return wrapper
+
+# 用到的akshare接口在导入时包装一次重试，调用处直接调用
+_report_api = with_retry(ak.stock_financial_report_sina)
+_stock_list_api = with_retry(ak.stock_info_a_code_name)
+
+class FileCache:
+    """基于本地文件的TTL缓存，DataFrame以pickle格式落盘"""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _key(self, fn_name, args):
+        raw = json.dumps([CACHE_VERSION, fn_name, list(args)], ensure_ascii=False)
+        return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+    def get(self, fn_name, args, ttl):
+        """读取未过期的缓存，未命中返回None"""
+        meta_path = os.path.join(self.cache_dir, self._key(fn_name, args) + '.json')
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if time.time() - meta['ts'] > ttl:
+                return None
+            return pd.read_pickle(meta['payload_path'])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("读取缓存失败 %s%s: %s", fn_name, args, e)
+            return None
 
-def safe_api_call(func, *args, **kwargs):
-    """安全的API调用，带重试机制"""
-    max_retries = 3
-    for i in range(max_retries):
+    def _atomic_write(self, path, write):
+        """写入独占的临时文件（多进程、多线程各不相同）后原子替换目标文件"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
         try:
-            time.sleep(0.5)  # 添加延迟避免请求过快
-            result = func(*args, **kwargs)
-            return result
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def set(self, fn_name, args, df):
+        """写入缓存，先写临时文件再替换，避免并发读到半截文件"""
+        key = self._key(fn_name, args)
+        payload_path = os.path.join(self.cache_dir, key + '.pkl')
+        meta_path = os.path.join(self.cache_dir, key + '.json')
+        meta = json.dumps({'ts': time.time(), 'payload_path': payload_path}).encode('utf-8')
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._atomic_write(payload_path, df.to_pickle)
+            self._atomic_write(meta_path, lambda f: f.write(meta))
         except Exception as e:
-            print(f"API call failed (attempt {i+1}/{max_retries}): {str(e)}")
-            if i == max_retries - 1:
-                raise
-            time.sleep(1)
-    return None
-
-def calculate_financial_indicators(stock_code):
-    """计算五大核心指标和详细财务信息"""
+            logger.warning("写入缓存失败 %s%s: %s", fn_name, args, e)
+
+    def cached(self, ttl):
+        """装饰器：按函数名和参数缓存返回的DataFrame，空结果不缓存"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                df = self.get(func.__name__, args, ttl)
+                if df is not None:
+                    return df
+                df = func(*args)
+                if df is not None and not df.empty:
+                    self.set(func.__name__, args, df)
+                return df
+            return wrapper
+        return decorator
+
+def _normalize(df):
+    """以项目名为索引（重名保留第一行），各报告期列统一转为float，'--'、空串等无法解析的记为NaN"""
+    label_col = df.columns[0]
+    df = df.drop_duplicates(subset=label_col).set_index(label_col)
+    df.index = df.index.astype(str)
+    values = df.replace({',': '', ' ': ''}, regex=True)
+    return values.apply(pd.to_numeric, errors='coerce')
+
+_file_cache = FileCache()
+
+@_file_cache.cached(ttl=REPORT_CACHE_TTL)
+def cached_report(stock_code, symbol):
+    """获取财务报表并转为数值（带文件缓存，转换只在获取时做一次）"""
+    df = _report_api(stock=stock_code, symbol=symbol)
+    if df is None or df.empty:
+        return df
+    return _normalize(df)
+
+@_file_cache.cached(ttl=STOCK_LIST_CACHE_TTL)
+def cached_stock_list():
+    """获取A股代码名称列表（带文件缓存）"""
+    return _stock_list_api()
+
+# 进程内共享的网络请求线程池，避免每个请求新建线程
+_executor = ThreadPoolExecutor(max_workers=FETCH_POOL_SIZE, thread_name_prefix='akshare')
+
+# 正在进行中的报表请求，同一报表的并发请求共享一次网络调用
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+class _EmptyReport(Exception):
+    """报表为空，以异常形式跳出 lru_cache，使空结果不被缓存"""
+
+def _fetch_report(stock_code, symbol):
+    """获取财务报表（进程内缓存），为空时返回None；返回的DataFrame为共享对象，调用方不得修改"""
+    try:
+        return _fetch_report_memo(stock_code, symbol)
+    except _EmptyReport:
+        return None
+
+@functools.lru_cache(maxsize=256)
+def _fetch_report_memo(stock_code, symbol):
+    """进程内缓存非空的财务报表，同一报表的并发请求共享一次获取"""
+    key = (stock_code, symbol)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _inflight[key] = future
+
+    if not is_owner:
+        return future.result()
+
+    try:
+        df = cached_report(stock_code, symbol)
+        if df is None or df.empty:
+            raise _EmptyReport(key)
+        future.set_result(df)
+    except Exception as e:
+        future.set_exception(e)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+    return future.result()
+
+def _schedule_report_cache_clear():
+    """定时清空进程内报表缓存，避免长期运行时数据过旧"""
+    def tick():
+        _fetch_report_memo.cache_clear()
+        _schedule_report_cache_clear()
+
+    timer = threading.Timer(MEMORY_CACHE_CLEAR_INTERVAL, tick)
+    timer.daemon = True
+    timer.start()
+
+_schedule_report_cache_clear()
+
+# 常驻内存的A股列表缓存：df为原始列表，code_to_name为 {代码: 名称} 字典，
+# search_rows为 (“代码\x1f名称”小写, 代码, 名称) 列表供搜索使用，ts为最近一次加载（含失败）的时间。
+# 每次刷新整体替换该字典，读取方拿到的始终是同一次加载的数据
+_stock_info_cache = {'df': None, 'code_to_name': None, 'search_rows': None, 'ts': 0}
+_stock_info_lock = threading.Lock()
+
+def _fetch_stock_list_fresh():
+    """绕过文件缓存和akshare自身的lru_cache获取最新A股列表，成功后回写文件缓存"""
+    cache_clear = getattr(ak.stock_info_a_code_name, 'cache_clear', None)
+    if cache_clear is not None:
+        cache_clear()
+    stock_info = _stock_list_api()
+    if stock_info is not None and not stock_info.empty:
+        _file_cache.set(cached_stock_list.__name__, (), stock_info)
+    return stock_info
+
+def _load_stock_info():
+    """加载A股列表到内存缓存（冷启动读文件缓存，之后的刷新重新获取），失败时保留旧数据并推迟到下个周期再试"""
+    global _stock_info_cache
+    try:
+        if _stock_info_cache['df'] is None:
+            stock_info = cached_stock_list()
+        else:
+            stock_info = _fetch_stock_list_fresh()
+        if stock_info is None or stock_info.empty:
+            raise ValueError("股票列表为空")
+        codes = stock_info['code'].astype(str)
+        names = stock_info['name'].astype(str)
+        # 代码重复时保留第一条
+        code_to_name = dict(zip(codes[::-1], names[::-1]))
+        search_hay = (codes + '\x1f' + names).str.lower()
+        _stock_info_cache = {
+            'df': stock_info,
+            'code_to_name': code_to_name,
+            'search_rows': list(zip(search_hay, codes, names)),
+            'ts': time.time()
+        }
+    except Exception as e:
+        logger.error("加载股票列表失败: %s", e)
+        _stock_info_cache = dict(_stock_info_cache, ts=time.time())
+
+def get_stock_info_cached():
+    """获取内存中的A股列表缓存，未加载时同步加载；已过期时直接返回旧数据并在后台刷新"""
+    cache = _stock_info_cache
+    if cache['df'] is None:
+        # 刚加载失败时直接返回空缓存，不让排队的请求逐个重新下载
+        if time.time() - cache['ts'] <= STOCK_LIST_RETRY_INTERVAL:
+            return cache
+        with _stock_info_lock:
+            cache = _stock_info_cache
+            if cache['df'] is None and time.time() - cache['ts'] > STOCK_LIST_RETRY_INTERVAL:
+                _load_stock_info()
+                cache = _stock_info_cache
+    elif time.time() - cache['ts'] > STOCK_LIST_REFRESH_INTERVAL:
+        _executor.submit(_refresh_stale_stock_info)
+    return cache
+
+def _refresh_stale_stock_info():
+    """后台刷新过期的A股列表，已有线程在刷新时直接返回，不排队等待"""
+    if not _stock_info_lock.acquire(blocking=False):
+        return
     try:
-        print(f"开始获取 {stock_code} 的财务数据...")
+        if time.time() - _stock_info_cache['ts'] > STOCK_LIST_REFRESH_INTERVAL:
+            _load_stock_info()
+    finally:
+        _stock_info_lock.release()
+
+def _refresh_stock_info():
+    """后台定时刷新A股列表，使请求路径上基本不需要同步刷新"""
+    with _stock_info_lock:
+        _load_stock_info()
+    _schedule_stock_info_refresh(STOCK_LIST_REFRESH_INTERVAL)
+
+def _schedule_stock_info_refresh(delay):
+    timer = threading.Timer(delay, _refresh_stock_info)
+    timer.daemon = True
+    timer.start()
+
+# 首次加载同样放在后台线程：冷启动时下载列表可能超过30秒，
+# 若在导入时同步执行，gunicorn worker会在启动完成前因超时被杀
+_schedule_stock_info_refresh(0)
+
+def _extract_values(df, rows, columns):
+    """一次性取出指定行的各期数值（报表已由 _normalize 转为数值），返回 {项目名: [本期, 上期]}，缺失的记为0"""
+    table = df.reindex(index=list(rows), columns=list(columns)).fillna(0)
+    return dict(zip(rows, table.to_numpy().tolist()))
+
+def _core_ratios(total_assets, total_liabilities, current_assets, current_liabilities,
+                 accounts_payable, accounts_receivable, revenue, net_profit,
+                 operating_cost, operating_cashflow):
+    """计算单期五大核心指标，分母不为正时记为0"""
+    return (
+        # 1. 资产负债率
+        total_liabilities / total_assets * 100 if total_assets > 0 else 0,
+        # 2. 应付账款周转率
+        operating_cost / accounts_payable if accounts_payable > 0 else 0,
+        # 3. 利润变现率（经营现金流/净利润）
+        operating_cashflow / net_profit if net_profit > 0 else 0,
+        # 4. 短期负债偿还能力（流动比率）
+        current_assets / current_liabilities * 100 if current_liabilities > 0 else 0,
+        # 5. 应收账款周转率
+        revenue / accounts_receivable if accounts_receivable > 0 else 0,
+    )
+
+def _core_item(current, previous, unit=''):
+    """核心指标的数值表示"""
+    return {'value': float(current), 'previous': float(previous), 'unit': unit}
+
+def calculate_financial_indicators(stock_code, include_details=True):
+    """计算五大核心指标和详细财务信息（include_details为False时不提取详细数据）"""
+    try:
+        logger.debug("开始获取 %s 的财务数据...", stock_code)
 
-        # 使用安全调用获取数据
-        balance = safe_api_call(ak.stock_financial_report_sina, stock=stock_code, symbol="资产负债表")
-        income = safe_api_call(ak.stock_financial_report_sina, stock=stock_code, symbol="利润表")
-        cashflow = safe_api_call(ak.stock_financial_report_sina, stock=stock_code, symbol="现金流量表")
+        # 三张报表互不依赖，并发获取
+        balance, income, cashflow = _executor.map(
+            lambda symbol: _fetch_report(stock_code, symbol), REPORT_SYMBOLS
+        )
 
         if balance is None or balance.empty:
-            print(f"无法获取 {stock_code} 的资产负债表")
+            logger.warning("无法获取 %s 的资产负债表", stock_code)
             return None
 
         if income is None or income.empty:
-            print(f"无法获取 {stock_code} 的利润表")
+            logger.warning("无法获取 %s 的利润表", stock_code)
             return None
 
         if cashflow is None or cashflow.empty:
-            print(f"无法获取 {stock_code} 的现金流量表")
+            logger.warning("无法获取 %s 的现金流量表", stock_code)
             return None
 
-        print(f"成功获取数据，资产负债表列数: {len(balance.columns)}")
+        logger.debug("成功获取数据，资产负债表列数: %d", len(balance.columns))
 
-        # 提取本期数和上期数（第2列和第3列）
-        if len(balance.columns) < 2:
-            print("数据列数不足")
+        # 提取本期数和上期数（项目名已作为索引，第1列和第2列为报告期）
+        if len(balance.columns) < 1:
+            logger.warning("数据列数不足: %s", stock_code)
             return None
 
-        current_col = balance.columns[1]
-        previous_col = balance.columns[2] if len(balance.columns) > 2 else balance.columns[1]
+        current_col = balance.columns[0]
+        previous_col = balance.columns[1] if len(balance.columns) > 1 else balance.columns[0]
 
-        print(f"报告期: {current_col}, 上期: {previous_col}")
+        logger.debug("报告期: %s, 上期: %s", current_col, previous_col)
 
-        # 辅助函数：安全获取数值
-        def get_value(df, row_name, col):
-            try:
-                row = df[df.iloc[:, 0] == row_name]
-                if not row.empty:
-                    val = row.iloc[0][col]
-                    # 清理数值
-                    if isinstance(val, str):
-                        val = val.replace(',', '').replace('--', '0')
-                    return float(val) if val not in ['', '--', None] else 0
-                return 0
-            except Exception as e:
-                print(f"获取 {row_name} 出错: {str(e)}")
-                return 0
+        columns = (current_col, previous_col)
+
+        # 核心指标所需数值按报表一次性提取
+        bal_vals = _extract_values(balance, NEEDED_ROWS_BY_DF['balance'], columns)
+        inc_vals = _extract_values(income, NEEDED_ROWS_BY_DF['income'], columns)
+        cf_vals = _extract_values(cashflow, NEEDED_ROWS_BY_DF['cashflow'], columns)
 
         # 提取关键财务数据
         # 资产负债表数据
-        total_assets_current = get_value(balance, '资产总计', current_col)
-        total_assets_previous = get_value(balance, '资产总计', previous_col)
-        total_liabilities_current = get_value(balance, '负债合计', current_col)
-        total_liabilities_previous = get_value(balance, '负债合计', previous_col)
-        current_assets = get_value(balance, '流动资产合计', current_col)
-        current_assets_previous = get_value(balance, '流动资产合计', previous_col)
-        current_liabilities = get_value(balance, '流动负债合计', current_col)
-        current_liabilities_previous = get_value(balance, '流动负债合计', previous_col)
-        accounts_payable_current = get_value(balance, '应付账款', current_col)
-        accounts_payable_previous = get_value(balance, '应付账款', previous_col)
-        accounts_receivable_current = get_value(balance, '应收账款', current_col)
-        accounts_receivable_previous = get_value(balance, '应收账款', previous_col)
-        cash_current = get_value(balance, '货币资金', current_col)
-        cash_previous = get_value(balance, '货币资金', previous_col)
+        total_assets_current, total_assets_previous = bal_vals['资产总计']
+        total_liabilities_current, total_liabilities_previous = bal_vals['负债合计']
+        current_assets, current_assets_previous = bal_vals['流动资产合计']
+        current_liabilities, current_liabilities_previous = bal_vals['流动负债合计']
+        accounts_payable_current, accounts_payable_previous = bal_vals['应付账款']
+        accounts_receivable_current, accounts_receivable_previous = bal_vals['应收账款']
+        cash_current, cash_previous = bal_vals['货币资金']
 
         # 利润表数据
-        revenue_current = get_value(income, '营业收入', current_col)
-        revenue_previous = get_value(income, '营业收入', previous_col)
-        net_profit_current = get_value(income, '净利润', current_col)
-        net_profit_previous = get_value(income, '净利润', previous_col)
-        operating_cost_current = get_value(income, '营业成本', current_col)
-        operating_cost_previous = get_value(income, '营业成本', previous_col)
+        revenue_current, revenue_previous = inc_vals['营业收入']
+        net_profit_current, net_profit_previous = inc_vals['净利润']
+        operating_cost_current, operating_cost_previous = inc_vals['营业成本']
 
         # 现金流量表数据
-        operating_cashflow_current = get_value(cashflow, '经营活动产生的现金流量净额', current_col)
-        operating_cashflow_previous = get_value(cashflow, '经营活动产生的现金流量净额', previous_col)
+        operating_cashflow_current, operating_cashflow_previous = cf_vals['经营活动产生的现金流量净额']
 
-        print(f"关键指标: 资产={total_assets_current}, 负债={total_liabilities_current}, 营收={revenue_current}")
+        logger.debug("关键指标: 资产=%s, 负债=%s, 营收=%s",
+                     total_assets_current, total_liabilities_current, revenue_current)
 
         # 计算核心指标
-        # 1. 资产负债率
-        debt_ratio_current = (total_liabilities_current / total_assets_current * 100) if total_assets_current > 0 else 0
-        debt_ratio_previous = (total_liabilities_previous / total_assets_previous * 100) if total_assets_previous > 0 else 0
-
-        # 2. 应付账款周转率
-        payable_turnover_current = (operating_cost_current / accounts_payable_current) if accounts_payable_current > 0 else 0
-        payable_turnover_previous = (operating_cost_previous / accounts_payable_previous) if accounts_payable_previous > 0 else 0
-
-        # 3. 利润变现率（净利润/经营现金流）
-        profit_cash_rate_current = (operating_cashflow_current / net_profit_current) if net_profit_current > 0 else 0
-        profit_cash_rate_previous = (operating_cashflow_previous / net_profit_previous) if net_profit_previous > 0 else 0
-
-        # 4. 短期负债偿还能力（流动比率）
-        current_ratio = (current_assets / current_liabilities * 100) if current_liabilities > 0 else 0
-        current_ratio_previous = (current_assets_previous / current_liabilities_previous * 100) if current_liabilities_previous > 0 else 0
-
-        # 5. 应收账款周转率
-        receivable_turnover_current = (revenue_current / accounts_receivable_current) if accounts_receivable_current > 0 else 0
-        receivable_turnover_previous = (revenue_previous / accounts_receivable_previous) if accounts_receivable_previous > 0 else 0
+        (debt_ratio_current, payable_turnover_current, profit_cash_rate_current,
+         current_ratio, receivable_turnover_current) = _core_ratios(
+            total_assets_current, total_liabilities_current, current_assets, current_liabilities,
+            accounts_payable_current, accounts_receivable_current, revenue_current,
+            net_profit_current, operating_cost_current, operating_cashflow_current)
+        (debt_ratio_previous, payable_turnover_previous, profit_cash_rate_previous,
+         current_ratio_previous, receivable_turnover_previous) = _core_ratios(
+            total_assets_previous, total_liabilities_previous, current_assets_previous, current_liabilities_previous,
+            accounts_payable_previous, accounts_receivable_previous, revenue_previous,
+            net_profit_previous, operating_cost_previous, operating_cashflow_previous)
 
         # 构建完整数据结构
         result = {
             'report_date': current_col,
             'previous_date': previous_col,
+            # 核心指标只返回数值，显示格式、趋势和环比由前端计算
             'coreIndicators': {
-                'debtRatio': {
-                    'value': f"{debt_ratio_current:.1f}%",
-                    'previous': f"{debt_ratio_previous:.1f}%",
-                    'trend': 'up' if debt_ratio_current > debt_ratio_previous else 'down' if debt_ratio_current < debt_ratio_previous else 'neutral',
-                    'change': f"{debt_ratio_current - debt_ratio_previous:+.1f}%"
-                },
-                'payableTurnover': {
-                    'value': f"{payable_turnover_current:.1f}",
-                    'previous': f"{payable_turnover_previous:.1f}",
-                    'trend': 'up' if payable_turnover_current > payable_turnover_previous else 'down' if payable_turnover_current < payable_turnover_previous else 'neutral',
-                    'change': f"{((payable_turnover_current - payable_turnover_previous) / payable_turnover_previous * 100):+.0f}%" if payable_turnover_previous > 0 else "N/A"
-                },
-                'profitCashRate': {
-                    'value': f"{profit_cash_rate_current:.1f}",
-                    'previous': f"{profit_cash_rate_previous:.1f}",
-                    'trend': 'up' if profit_cash_rate_current > profit_cash_rate_previous else 'down' if profit_cash_rate_current < profit_cash_rate_previous else 'neutral',
-                    'change': f"{((profit_cash_rate_current - profit_cash_rate_previous) / profit_cash_rate_previous * 100):+.0f}%" if profit_cash_rate_previous > 0 else "N/A"
-                },
-                'currentRatio': {
-                    'value': f"{current_ratio:.0f}%",
-                    'previous': f"{current_ratio_previous:.0f}%",
-                    'trend': 'up' if current_ratio > current_ratio_previous else 'down' if current_ratio < current_ratio_previous else 'neutral',
-                    'change': f"{current_ratio - current_ratio_previous:+.0f}%"
-                },
-                'receivableTurnover': {
-                    'value': f"{receivable_turnover_current:.1f}",
-                    'previous': f"{receivable_turnover_previous:.1f}",
-                    'trend': 'up' if receivable_turnover_current > receivable_turnover_previous else 'down' if receivable_turnover_current < receivable_turnover_previous else 'neutral',
-                    'change': f"{((receivable_turnover_current - receivable_turnover_previous) / receivable_turnover_previous * 100):+.0f}%" if receivable_turnover_previous > 0 else "N/A"
-                }
+                'debtRatio': _core_item(debt_ratio_current, debt_ratio_previous, '%'),
+                'payableTurnover': _core_item(payable_turnover_current, payable_turnover_previous),
+                'profitCashRate': _core_item(profit_cash_rate_current, profit_cash_rate_previous),
+                'currentRatio': _core_item(current_ratio, current_ratio_previous, '%'),
+                'receivableTurnover': _core_item(receivable_turnover_current, receivable_turnover_previous)
             },
-            'detailData': {
-                'cashFlowRisk': extract_detail_data(balance, cashflow, income, current_col, previous_col, 'cash'),
-                'supplyChainRisk': extract_detail_data(balance, cashflow, income, current_col, previous_col, 'supply'),
-                'profitabilityRisk': extract_detail_data(balance, cashflow, income, current_col, previous_col, 'profit'),
-                'otherRisk': extract_detail_data(balance, cashflow, income, current_col, previous_col, 'other')
-            }
         }
+        if include_details:
+            result['detailData'] = extract_all_details(balance, cashflow, income, current_col, previous_col)
 
-        print("数据处理成功")
+        logger.debug("数据处理成功")
         return result
 
     except Exception as e:
-        print(f"Error calculating indicators: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error calculating indicators: %s", e)
         return None
 
-def extract_detail_data(balance, cashflow, income, current_col, previous_col, category):
-    """提取详细财务数据"""
-    def get_value(df, row_name, col):
-        try:
-            row = df[df.iloc[:, 0] == row_name]
-            if not row.empty:
-                val = row.iloc[0][col]
-                if isinstance(val, str):
-                    val = val.replace(',', '')
-                if val in ['', '--', None]:
-                    return "缺失"
-                return f"{float(val):,.0f}"
-            return "缺失"
-        except:
-            return "缺失"
+# 按 (股票代码, 是否含详细数据) 缓存计算结果；计算失败返回的None不缓存
+_indicator_cache = TTLCache(maxsize=512, ttl=INDICATOR_CACHE_TTL)
+_indicator_cache_lock = threading.Lock()
+
+def get_financial_indicators_cached(stock_code, include_details=True):
+    """获取财务指标（带TTL缓存），只要核心指标时优先从已缓存的完整结果中截取"""
+    with _indicator_cache_lock:
+        result = _indicator_cache.get((stock_code, True))
+        if result is None and not include_details:
+            result = _indicator_cache.get((stock_code, False))
+    if result is not None:
+        if not include_details and 'detailData' in result:
+            result = {key: value for key, value in result.items() if key != 'detailData'}
+        return result
+
+    result = calculate_financial_indicators(stock_code, include_details)
+    if result is not None:
+        with _indicator_cache_lock:
+            _indicator_cache[(stock_code, include_details)] = result
+    return result
+
+def extract_all_details(balance, cashflow, income, current_col, previous_col):
+    """一次性提取四类详细财务数据（报表需经 _normalize 处理）"""
+    def period_lookup(df):
+        """{项目名: [本期, 上期]}，每张报表只建一次，逐项取值只需dict查找"""
+        table = df.reindex(columns=[current_col, previous_col])
+        return dict(zip(table.index, table.to_numpy().tolist()))
+
+    lookups = {
+        'balance': period_lookup(balance),
+        'income': period_lookup(income),
+        'cashflow': period_lookup(cashflow)
+    }
+    current_pos, previous_pos = 0, 1
+
+    def get_value(lookup, row_name, pos):
+        """返回float，缺失时返回None"""
+        row = lookup.get(row_name)
+        if row is None or math.isnan(row[pos]):
+            return None
+        return row[pos]
+
+    def fmt(val):
+        return "缺失" if val is None else format(val, ',.0f')
 
     def calc_change(current, previous):
-        try:
-            if current == "缺失" or previous == "缺失":
-                return "缺失"
-            c = float(current.replace(',', ''))
-            p = float(previous.replace(',', ''))
-            if p == 0:
-                return "N/A"
-            change = ((c - p) / p * 100)
-            return f"{change:+.0f}%"
-        except:
+        if current is None or previous is None:
             return "缺失"
+        if previous == 0:
+            return "N/A"
+        return f"{(current - previous) / previous * 100:+.0f}%"
+
+    def current_ratio_item():
+        ca_c = get_value(lookups['balance'], '流动资产合计', current_pos)
+        cl_c = get_value(lookups['balance'], '流动负债合计', current_pos)
+        ca_p = get_value(lookups['balance'], '流动资产合计', previous_pos)
+        cl_p = get_value(lookups['balance'], '流动负债合计', previous_pos)
+
+        if None in (ca_c, cl_c, ca_p, cl_p) or cl_c == 0 or cl_p == 0:
+            return {'current': '缺失', 'previous': '缺失', 'change': '缺失'}
+        ratio_c = ca_c / cl_c * 100
+        ratio_p = ca_p / cl_p * 100
+        return {
+            'current': f"{ratio_c:.0f}%",
+            'previous': f"{ratio_p:.0f}%",
+            'change': f"{ratio_c - ratio_p:+.0f}%"
+        }
+
+    entries = {}
+    for df_key, item_name in DETAIL_ITEMS:
+        if df_key is None:
+            entries[(df_key, item_name)] = current_ratio_item()
+            continue
+        lookup = lookups[df_key]
+        current = get_value(lookup, item_name, current_pos)
+        previous = get_value(lookup, item_name, previous_pos)
+        entries[(df_key, item_name)] = {
+            'current': fmt(current),
+            'previous': fmt(previous),
+            'change': calc_change(current, previous)
+        }
 
-    data = {}
-
-    if category == 'cash':
-        items = [
-            ('货币资金', balance),
-            ('流动负债合计', balance),
-            ('流动比率', None),
-            ('经营活动产生的现金流量净额', cashflow),
-            ('净利润', income),
-            ('营业成本', income)
-        ]
-
-        for item_name, df in items:
-            if df is not None:
-                current = get_value(df, item_name, current_col)
-                previous = get_value(df, item_name, previous_col)
-                data[item_name] = {
-                    'current': current,
-                    'previous': previous,
-                    'change': calc_change(current, previous)
-                }
-            elif item_name == '流动比率':
-                ca_c = get_value(balance, '流动资产合计', current_col)
-                cl_c = get_value(balance, '流动负债合计', current_col)
-                ca_p = get_value(balance, '流动资产合计', previous_col)
-                cl_p = get_value(balance, '流动负债合计', previous_col)
-
-                try:
-                    ratio_c = f"{(float(ca_c.replace(',', '')) / float(cl_c.replace(',', '')) * 100):.0f}%"
-                    ratio_p = f"{(float(ca_p.replace(',', '')) / float(cl_p.replace(',', '')) * 100):.0f}%"
-                    data['流动比率'] = {
-                        'current': ratio_c,
-                        'previous': ratio_p,
-                        'change': f"{float(ratio_c[:-1]) - float(ratio_p[:-1]):+.0f}%"
-                    }
-                except:
-                    data['流动比率'] = {'current': '缺失', 'previous': '缺失', 'change': '缺失'}
-
-    elif category == 'supply':
-        items = [
-            ('应付账款', balance),
-            ('预付款项', balance),
-            ('应付票据', balance)
-        ]
-
-        for item_name, df in items:
-            current = get_value(df, item_name, current_col)
-            previous = get_value(df, item_name, previous_col)
-            data[item_name] = {
-                'current': current,
-                'previous': previous,
-                'change': calc_change(current, previous)
-            }
-
-    elif category == 'profit':
-        items = [
-            ('净利润', income),
-            ('营业收入', income),
-            ('营业成本', income),
-            ('营业利润', income),
-            ('利润总额', income)
-        ]
-
-        for item_name, df in items:
-            current = get_value(df, item_name, current_col)
-            previous = get_value(df, item_name, previous_col)
-            data[item_name] = {
-                'current': current,
-                'previous': previous,
-                'change': calc_change(current, previous)
-            }
-
-    elif category == 'other':
-        items = [
-            ('应收账款', balance),
-            ('存货', balance),
-            ('固定资产', balance),
-            ('无形资产', balance),
-            ('资产总计', balance),
-            ('负债合计', balance)
-        ]
-
-        for item_name, df in items:
-            current = get_value(df, item_name, current_col)
-            previous = get_value(df, item_name, previous_col)
-            data[item_name] = {
-                'current': current,
-                'previous': previous,
-                'change': calc_change(current, previous)
-            }
-
-    return data
+    return {
+        category: {item_name: entries[(df_key, item_name)] for df_key, item_name in items}
+        for category, items in CATEGORY_SPECS.items()
+    }
 
 @app.route('/')
 def index():
@@ -312,69 +594,102 @@ def search_companies():
         return jsonify([])
 
     try:
-        print(f"搜索公司: {query}")
+        logger.debug("搜索公司: %s", query)
         # 获取A股上市公司列表
-        stock_info = safe_api_call(ak.stock_info_a_code_name)
+        search_rows = get_stock_info_cached()['search_rows']
 
-        if stock_info is None or stock_info.empty:
-            print("无法获取股票列表")
+        if search_rows is None:
             return jsonify([])
 
-        # 模糊搜索
-        results = stock_info[
-            stock_info['code'].str.contains(query, na=False) |
-            stock_info['name'].str.contains(query, na=False)
-        ].head(10)
+        # 模糊搜索（按普通子串匹配，不区分大小写），凑满10条即停止扫描
+        keyword = query.lower()
+        results = []
+        for hay, code, name in search_rows:
+            if keyword in hay:
+                results.append({'code': code, 'name': name})
+                if len(results) == SEARCH_RESULT_LIMIT:
+                    break
 
-        print(f"找到 {len(results)} 个结果")
-        return jsonify(results.to_dict('records'))
+        logger.debug("找到 %d 个结果", len(results))
+        return jsonify(results)
 
     except Exception as e:
-        print(f"Search error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Search error: %s", e)
         return jsonify([])
 
+def _etag_matches(etag):
+    """请求的If-None-Match是否命中ETag（flask-compress会给压缩响应的ETag加上:gzip等后缀）"""
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag:
+        return True
+    return any(tag.split(':', 1)[0] == etag for tag in if_none_match.as_set())
+
+def _set_cache_headers(response, etag):
+    """设置公司数据响应的ETag与缓存头"""
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = COMPANY_RESPONSE_MAX_AGE
+    return response
+
 @app.route('/api/company/<stock_code>', methods=['GET'])
 def get_company_data(stock_code):
     """获取公司财务数据"""
     try:
-        print(f"获取公司数据: {stock_code}")
+        logger.debug("获取公司数据: %s", stock_code)
+
+        # fields=core 时只返回核心指标（列表等场景），跳过详细数据的提取
+        fields = 'core' if request.args.get('fields') == 'core' else 'all'
+        include_details = fields == 'all'
+
+        # 获取公司基本信息；若股票列表尚未加载（启动中或获取失败），与财务数据并发加载
+        list_future = None
+        code_to_name = None
+        if _stock_info_cache['df'] is None:
+            list_future = _executor.submit(get_stock_info_cached)
+        else:
+            code_to_name = get_stock_info_cached()['code_to_name']
+            if stock_code not in code_to_name:
+                return jsonify({'error': 'Company not found'}), 404
 
-        # 获取公司基本信息
-        stock_info = safe_api_call(ak.stock_info_a_code_name)
+        # 计算财务指标
+        financial_data = get_financial_indicators_cached(stock_code, include_details)
 
-        if stock_info is None or stock_info.empty:
-            return jsonify({'error': '无法获取公司列表'}), 500
+        if list_future is not None:
+            code_to_name = list_future.result()['code_to_name']
 
-        company_info = stock_info[stock_info['code'] == stock_code]
+        if code_to_name is None:
+            return jsonify({'error': '无法获取公司列表'}), 500
 
-        if company_info.empty:
+        name = code_to_name.get(stock_code)
+        if name is None:
             return jsonify({'error': 'Company not found'}), 404
 
-        # 计算财务指标
-        financial_data = calculate_financial_indicators(stock_code)
-
         if financial_data is None:
             return jsonify({'error': 'Failed to fetch financial data'}), 500
 
+        # 同一股票同一报告期、同一名称的数据不变，ETag由这几项生成（公司改名如戴帽*ST时随之变化）；命中时直接返回304，不再序列化
+        etag = hashlib.md5(
+            f"{COMPANY_RESPONSE_VERSION}:{stock_code}:{name}:{financial_data['report_date']}:{fields}".encode()
+        ).hexdigest()
+        if _etag_matches(etag):
+            return _set_cache_headers(app.response_class(status=304), etag)
+
         result = {
             'code': stock_code,
-            'name': company_info.iloc[0]['name'],
+            'name': name,
             'financial_data': financial_data
         }
 
-        return jsonify(result)
+        # 财报按季度更新，允许客户端缓存
+        response = _set_cache_headers(jsonify(result), etag)
+        return response.make_conditional(request)
 
     except Exception as e:
-        print(f"Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    import os
     port = int(os.environ.get('PORT', 5000))
-    print("启动供应商财务健康度分析系统...")
-    print(f"请访问: http://localhost:{port}")
+    logger.info("启动供应商财务健康度分析系统...")
+    logger.info("请访问: http://localhost:%d", port)
     app.run(host='0.0.0.0', debug=False, port=port)
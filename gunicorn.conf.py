@@ -0,0 +1,8 @@
+"""gunicorn配置：接口耗时主要在akshare网络请求上，用少量进程+多线程提高并发"""
+import os
+
+# 每个进程各自持有内存缓存（股票列表、报表、计算结果），进程少、线程多更省内存，缓存命中率也更高
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
@@ -0,0 +1,5 @@
+"""WSGI入口，供gunicorn等生产服务器加载"""
+from app import app
+
+if __name__ == '__main__':
+    app.run()